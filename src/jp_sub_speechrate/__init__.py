@@ -1 +1 @@
-__all__ = ["cli", "parsing", "reading"]
+__all__ = ["cli", "parsing", "reading", "stats"]
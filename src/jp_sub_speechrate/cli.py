@@ -4,13 +4,13 @@ import os
 import sys
 
 try:
-    from .parsing import merge_intervals, parse_ass, parse_srt, strip_nonspoken
+    from .parsing import merged_duration_ms, parse_ass, parse_srt, strip_nonspoken
     from .reading import KanaReader
 except ImportError:
     # Allow running as a script: `uv run src/jp_sub_speechrate/cli.py ...`
     pkg_dir = os.path.dirname(__file__)
     sys.path.insert(0, os.path.dirname(pkg_dir))
-    from jp_sub_speechrate.parsing import merge_intervals, parse_ass, parse_srt, strip_nonspoken
+    from jp_sub_speechrate.parsing import merged_duration_ms, parse_ass, parse_srt, strip_nonspoken
     from jp_sub_speechrate.reading import KanaReader
 
 
@@ -30,6 +30,12 @@ def _percentile(sorted_vals: list[float], p: float) -> float:
 
 
 def _analyze_items(items, reader: KanaReader, unit: str, trim_outliers: bool):
+    strip_sokuon = unit == "kana"
+    count_fn = {
+        "mora": reader.count_mora,
+        "syllable": reader.count_syllable,
+        "kana": reader.count_kana,
+    }[unit]
     entries = []
     for start, end, text in items:
         if not text.strip():
@@ -40,14 +46,8 @@ def _analyze_items(items, reader: KanaReader, unit: str, trim_outliers: bool):
         duration_ms = end - start
         if duration_ms <= 0:
             continue
-        strip_sokuon = unit == "kana"
         reading = reader.to_kana(text, strip_sokuon=strip_sokuon)
-        if unit == "mora":
-            units = reader.count_mora(reading)
-        elif unit == "syllable":
-            units = reader.count_syllable(reading)
-        else:
-            units = reader.count_kana(reading)
+        units = count_fn(reading)
         if units <= 0:
             continue
         rate = units / (duration_ms / 1000.0 / 60.0)
@@ -70,9 +70,7 @@ def _analyze_items(items, reader: KanaReader, unit: str, trim_outliers: bool):
         return 0, 0.0, 0.0
 
     total_units = sum(e[2] for e in entries)
-    intervals = [(e[0], e[1]) for e in entries]
-    merged = merge_intervals(intervals)
-    total_ms = sum(e - s for s, e in merged)
+    total_ms = merged_duration_ms((e[0], e[1]) for e in entries)
     minutes = total_ms / 1000.0 / 60.0 if total_ms > 0 else 0.0
     rate = (total_units / minutes) if minutes > 0 else 0.0
     return total_units, minutes, rate
@@ -120,8 +118,7 @@ def main():
 
     trim_outliers = not args.include_outliers
     for path in files:
-        ext = os.path.splitext(path)[1].lower()
-        if ext == ".srt":
+        if path.lower().endswith(".srt"):
             items = parse_srt(path)
         else:
             items = parse_ass(path)
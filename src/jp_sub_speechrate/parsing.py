@@ -1,3 +1,6 @@
+import hashlib
+import os
+import pickle
 import re
 from typing import Iterable, List, Tuple
 
@@ -116,6 +119,30 @@ def merge_intervals(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int
     return [(s, e) for s, e in merged]
 
 
+def merged_duration_ms(intervals: Iterable[Tuple[int, int]]) -> int:
+    """Total covered time with overlaps merged, in one pass when possible.
+
+    Subtitle entries are normally already time-ordered, so overlapping
+    intervals are merged while scanning; an out-of-order start falls back
+    to the general sort-and-merge.
+    """
+    intervals = list(intervals)
+    if not intervals:
+        return 0
+    cur_s, cur_e = intervals[0]
+    total = 0
+    for start, end in intervals[1:]:
+        if start < cur_s:
+            return sum(en - st for st, en in merge_intervals(intervals))
+        if start <= cur_e:
+            if end > cur_e:
+                cur_e = end
+        else:
+            total += cur_e - cur_s
+            cur_s, cur_e = start, end
+    return total + (cur_e - cur_s)
+
+
 def _text_length(text: str) -> int:
     stripped = strip_nonspoken(text)
     return len(stripped.replace("\n", ""))
@@ -160,6 +187,48 @@ def parse_srt(path: str) -> List[Tuple[int, int, str]]:
     return merge_duplicate_items(items, max_gap_ms=3000, min_length_for_gap=8)
 
 
+def parse_file(path: str) -> List[Tuple[int, int, str]]:
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".srt":
+        return parse_srt(path)
+    if suffix == ".ass":
+        return parse_ass(path)
+    return []
+
+
+_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "jp-sub-speechrate")
+
+
+def parse_file_cached(path: str) -> List[Tuple[int, int, str]]:
+    """parse_file with an on-disk pickle cache keyed by path, mtime, and size.
+
+    A changed file gets a new cache key, so stale entries are never served;
+    cache failures of any kind fall back to parsing the file directly.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return parse_file(path)
+    key = f"{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}"
+    cache_path = os.path.join(_CACHE_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".pkl")
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError):
+        pass
+    items = parse_file(path)
+    try:
+        os.makedirs(_CACHE_DIR, exist_ok=True)
+        # Write-then-rename so concurrent workers never read a partial pickle.
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(items, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return items
+
+
 def _parse_ass_time(ts: str) -> int:
     # ASS time format: H:MM:SS.CC
     parts = ts.strip().split(":")
@@ -41,29 +41,120 @@ def _jiten_preprocess(text: str) -> str:
     return text
 
 
+# Joins batched texts into one tokenizer call; Sudachi keeps the separator
+# as its own 補助記号 token, so readings can be split back apart afterwards.
+_RECORD_SEP = "\u001e"
+# Sudachi rejects very long inputs (~49k bytes); keep joined batches well under.
+_BATCH_CHAR_LIMIT = 8000
+_CACHE_LIMIT = 200_000
+
+
 class KanaReader:
     def __init__(self):
         self._tokenizer = dictionary.Dictionary().create()
         self._mode = sudachi_tokenizer.Tokenizer.SplitMode.C
+        self._cache: dict[tuple[str, bool], str] = {}
 
     def to_kana(self, text: str, strip_sokuon: bool = True) -> str:
-        parts = []
-        text = _jiten_preprocess(text)
-        for token in self._tokenizer.tokenize(text, self._mode):
-            pos = token.part_of_speech()
-            # Skip whitespace tokens (including full-width space) before counting.
-            if pos and pos[0] == "空白":
+        pre = _jiten_preprocess(text)
+        key = (pre, strip_sokuon)
+        reading = self._cache.get(key)
+        if reading is None:
+            reading = self._convert(pre, strip_sokuon)
+            if len(self._cache) < _CACHE_LIMIT:
+                self._cache[key] = reading
+        return reading
+
+    def to_kana_batch(self, texts: Iterable[str], strip_sokuon: bool = True) -> list[str]:
+        """Convert many texts with as few tokenizer calls as possible.
+
+        Cached and repeated texts are converted once; the rest are joined
+        with a record separator and tokenized together, falling back to
+        per-text conversion if the separator does not round-trip cleanly.
+        """
+        pres = [_jiten_preprocess(t) for t in texts]
+        readings: dict[str, str] = {}
+        pending: list[str] = []
+        seen: set[str] = set()
+        for pre in pres:
+            if pre in readings or pre in seen:
                 continue
-            if pos and pos[0] in ("記号", "補助記号"):
+            cached = self._cache.get((pre, strip_sokuon))
+            if cached is not None:
+                readings[pre] = cached
+            else:
+                pending.append(pre)
+                seen.add(pre)
+
+        batch: list[str] = []
+        batch_len = 0
+        for pre in pending:
+            if batch and batch_len + len(pre) + 1 > _BATCH_CHAR_LIMIT:
+                self._convert_batch(batch, strip_sokuon, readings)
+                batch = []
+                batch_len = 0
+            batch.append(pre)
+            batch_len += len(pre) + 1
+        if batch:
+            self._convert_batch(batch, strip_sokuon, readings)
+        return [readings[pre] for pre in pres]
+
+    def _convert_batch(self, pres: list[str], strip_sokuon: bool, readings: dict[str, str]) -> None:
+        converted = self._convert_joined(pres, strip_sokuon)
+        if converted is None:
+            converted = [self._convert(pre, strip_sokuon) for pre in pres]
+        for pre, reading in zip(pres, converted):
+            readings[pre] = reading
+            if len(self._cache) < _CACHE_LIMIT:
+                self._cache[(pre, strip_sokuon)] = reading
+
+    def _convert_joined(self, pres: list[str], strip_sokuon: bool) -> list[str] | None:
+        if len(pres) == 1:
+            return [self._convert(pres[0], strip_sokuon)]
+        out: list[str] = []
+        parts: list[str] = []
+        for token in self._tokenizer.tokenize(_RECORD_SEP.join(pres), self._mode):
+            surface = token.surface()
+            if _RECORD_SEP in surface:
+                if surface.replace(_RECORD_SEP, ""):
+                    # Separator merged into a neighboring token; the batch
+                    # cannot be split apart reliably.
+                    return None
+                for _ in range(len(surface)):
+                    out.append("".join(parts))
+                    parts = []
                 continue
-            reading = token.reading_form()
-            if reading == "*":
-                reading = token.surface()
-            if strip_sokuon:
-                reading = SOKUON_RE.sub("", reading)
-            parts.append(reading)
+            reading = self._token_reading(token, strip_sokuon)
+            if reading:
+                parts.append(reading)
+        out.append("".join(parts))
+        if len(out) != len(pres):
+            return None
+        return out
+
+    def _convert(self, pre: str, strip_sokuon: bool) -> str:
+        parts = []
+        for token in self._tokenizer.tokenize(pre, self._mode):
+            reading = self._token_reading(token, strip_sokuon)
+            if reading:
+                parts.append(reading)
         return "".join(parts)
 
+    @staticmethod
+    def _token_reading(token, strip_sokuon: bool) -> str:
+        pos = token.part_of_speech()
+        # Skip whitespace tokens (including full-width space) before counting.
+        if pos and pos[0] == "空白":
+            return ""
+        if pos and pos[0] in ("記号", "補助記号"):
+            return ""
+        reading = token.reading_form()
+        if reading == "*":
+            reading = token.surface()
+        if strip_sokuon:
+            reading = SOKUON_RE.sub("", reading)
+        return reading
+
     @staticmethod
     def count_kana(text: str) -> int:
         return len(KANA_RE.findall(text))
@@ -0,0 +1,71 @@
+class PSquaredQuantile:
+    """Streaming quantile estimate using the P² algorithm (Jain & Chlamtac, 1985).
+
+    Maintains five markers whose heights approximate the p-quantile in a
+    single pass with O(1) memory, so large rate streams never need to be
+    materialized or sorted. Until five observations arrive, the exact
+    quantile of the buffered values is returned.
+    """
+
+    def __init__(self, p: float):
+        if not 0.0 < p < 1.0:
+            raise ValueError(f"p must be in (0, 1), got {p}")
+        self._p = p
+        self._heights: list[float] = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self._increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, value: float) -> None:
+        q = self._heights
+        if len(q) < 5:
+            q.append(value)
+            if len(q) == 5:
+                q.sort()
+            return
+
+        n = self._positions
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(1, 5):
+            self._desired[i] += self._increments[i]
+
+        for i in (1, 2, 3):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d >= 0 else -1
+                height = self._parabolic(i, step)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = self._linear(i, step)
+                q[i] = height
+                n[i] += step
+
+    def value(self) -> float:
+        q = self._heights
+        if not q:
+            return 0.0
+        if len(q) < 5:
+            ordered = sorted(q)
+            return ordered[int(self._p * (len(ordered) - 1))]
+        return q[2]
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self._heights, self._positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def _linear(self, i: int, d: int) -> float:
+        q, n = self._heights, self._positions
+        return q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])